@@ -1,128 +1,377 @@
 import statsapi  # pyright: ignore[reportMissingImports]
 import pandas as pd
-from tqdm import tqdm
+import numpy as np
+import requests_cache
 import os
-import pickle
-import matplotlib.pyplot as plt
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from functools import lru_cache
 from unidecode import unidecode
 
 CURRENT_SEASON = 2026 # Only using regular season games for now so can assume 2025 is completed
 SCHEDULE_CACHE = {}
 BOXSCORE_CACHE = {}
+ROSTER_CACHE = {}
+MAX_WORKERS = 16 # Concurrent boxscore requests
+MAX_RETRIES = 4 # Attempts per boxscore before giving up
+HTTP_CACHE_NAME = 'statsapi_cache'
+FINAL_STATUSES = ('Final', 'Game Over', 'Completed Early')
+# Stat -> (seasonStats category, or None if it appears in both; whether per-game values sum to a season total)
+STAT_INFO = {
+    'homeRuns': (None, True), 'hits': (None, True), 'runs': (None, True), 'rbi': (None, True),
+    'strikeOuts': (None, True), 'doubles': (None, True), 'triples': (None, True), 'baseOnBalls': (None, True),
+    'stolenBases': (None, True), 'atBats': (None, True), 'obp': (None, False),
+    'avg': ('batting', False), 'ops': ('batting', False), 'slg': ('batting', False), 'leftOnBase': ('batting', True),
+    'era': ('pitching', False), 'inningsPitched': ('pitching', False), 'earnedRuns': ('pitching', True),
+    'wins': ('pitching', True), 'losses': ('pitching', True), 'holds': ('pitching', True),
+    'blownSaves': ('pitching', True), 'numberOfPitches': ('pitching', True), 'pitchesThrown': ('pitching', True),
+    'strikes': ('pitching', True),
+}
+# seasonStats category for stats that only appear in one; others are chosen by the player's position
+STAT_CATEGORIES = {stat: category for stat, (category, _) in STAT_INFO.items() if category is not None}
+COUNTING_STATS = {stat for stat, (_, counting) in STAT_INFO.items() if counting}
+GAME_LOG_GROUPS = {'batting': 'hitting', 'pitching': 'pitching'} # seasonStats category -> game log stat group
 
-def update_stat(df, player, stat_dates):
-    """Update stat counts for a player in the dataframe."""
-    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
-        df['Date'] = pd.to_datetime(df['Date'])
-    df_dates = df['Date']
-
-    last_idx = 0
-    last_value = 0
-    for stat_date, value in stat_dates:
-        matches = df_dates[df_dates == stat_date]
-        if matches.empty:
-            print(f"Warning: No match found for {stat_date} for player {player}")
-            continue
-        idx = matches.index[0]
-        if idx - 1 >= last_idx:
-            df.loc[last_idx:idx-1, player] = last_value
-        if value is None:
-            value = 0
-        if last_value is None:
-            last_value = 0
-        if value == 0 and last_value > 0:
-            df.loc[idx, player] = last_value
-        else:
-            df.loc[idx, player] = value
-            last_value = value
-        last_idx = idx + 1
-    if last_idx < len(df):
-        df.loc[last_idx:, player] = last_value
+# Responses for completed seasons never change, so cache them on disk indefinitely
+requests_cache.install_cache(HTTP_CACHE_NAME, backend='sqlite', expire_after=None)
 
-def get_player_team_id(player_name, season):
-    """Get the team ID for a given player name."""
-    players = statsapi.lookup_player(player_name, season=season)
+def http_cache(season):
+    """Return a context manager that bypasses the HTTP cache for the in-progress season."""
+    return requests_cache.disabled() if season == CURRENT_SEASON else nullcontext()
+
+def get_date_index(df):
+    """Get the dataframe's dates as a sorted datetime64[D] array for fast lookups."""
+    dates = df['Date']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)
+    return dates.values.astype('datetime64[D]')
+
+def get_stat_dtype(stat_type):
+    """Get the column dtype for a stat: int16 for counting stats, float32 for rate stats."""
+    return np.int16 if stat_type in COUNTING_STATS else np.float32
+
+def fill_counting_stat(columns):
+    """Carry season totals forward to days without a game. Totals never decrease, so a running max does this."""
+    return np.maximum.accumulate(columns, axis=0)
+
+def fill_rate_stat(columns):
+    """Carry the most recent game's value forward to days without a game."""
+    last_game = np.where(columns != 0, np.arange(len(columns)).reshape(-1, 1), -1)
+    np.maximum.accumulate(last_game, axis=0, out=last_game)
+    return np.where(last_game >= 0, np.take_along_axis(columns, last_game, axis=0), 0)
+
+# Stats not listed here are rate stats (era, avg, ops, ...) and use fill_rate_stat
+CUMULATIVE_BUILDERS = {stat_type: fill_counting_stat for stat_type in COUNTING_STATS}
+
+def scatter_stat_dates(df_dates, player, stat_dates, column):
+    """Write a player's game values into their column on the matching dates from get_date_index."""
+    dates = np.array([stat_date for stat_date, _ in stat_dates], dtype='datetime64[D]')
+    values = np.array([value or 0 for _, value in stat_dates], dtype=np.float64)
+
+    idx = np.searchsorted(df_dates, dates)
+    found = idx < len(df_dates)
+    found[found] = df_dates[idx[found]] == dates[found]
+    for stat_date in dates[~found]:
+        print(f"Warning: No match found for {stat_date} for player {player}")
+
+    # A value of 0 means the player did not appear, so carry the previous value forward
+    played = found & (values != 0)
+    # Reversed so np.unique picks the later game on doubleheader days
+    game_idx, game_values = idx[played][::-1], values[played][::-1]
+    _, last = np.unique(game_idx, return_index=True)
+    column[game_idx[last]] = game_values[last]
+
+def build_stat_columns(df_dates, player_stats, stat_type):
+    """
+    Build the stat columns for several players at once, aligned to the dates from get_date_index.
+
+    Args:
+        df_dates: The dataframe's dates from get_date_index()
+        player_stats: Player name -> list of tuples (game_date, stat_value)
+        stat_type: The stat being tracked, which decides how values carry forward
+
+    Returns:
+        dict: Player name -> column array, for players with at least one game
+    """
+    players = [player for player, stat_dates in player_stats.items() if stat_dates]
+    columns = np.zeros((len(df_dates), len(players)), dtype=np.float64)
+    for i, player in enumerate(players):
+        scatter_stat_dates(df_dates, player, player_stats[player], columns[:, i])
+    columns = CUMULATIVE_BUILDERS.get(stat_type, fill_rate_stat)(columns)
+    columns = columns.astype(get_stat_dtype(stat_type))
+    return {player: columns[:, i] for i, player in enumerate(players)}
+
+@lru_cache(maxsize=None)
+def lookup_player(player_name, season):
+    """Look up a player by name, returning the first match or None. Results are cached per run."""
+    with http_cache(season):
+        players = statsapi.lookup_player(player_name, season=season)
     if not players:
         print(f"Warning: Player '{player_name}' not found")
+        return None
+    return players[0]
+
+def get_player_team_id(player_name, season):
+    """Get the team ID for a given player name."""
+    player = lookup_player(player_name, season)
+    if player is None:
         return 0
-    return players[0]['currentTeam']['id']
+    return player['currentTeam']['id']
+
+@lru_cache(maxsize=None)
+def get_player_game_log(player_name, season):
+    """
+    Get a player's hitting and pitching game logs for a season in a single request.
+
+    Args:
+        player_name: Name of the player to look up
+        season: The season year
+
+    Returns:
+        dict: Stat group ('hitting' or 'pitching') -> list of per-game splits; empty if the player
+            isn't found, or None if the game log is unavailable
+    """
+    player = lookup_player(player_name, season)
+    if player is None:
+        return {}
+    try:
+        with http_cache(season):
+            data = statsapi.get('person', {
+                'personId': player['id'],
+                'hydrate': f'stats(group=[hitting,pitching],type=[gameLog],season={season})',
+            })
+    except Exception as e:
+        print(f"Warning: Could not get game log for {player_name}: {e}")
+        return None
+    try:
+        return {stats['group']['displayName']: stats.get('splits', []) for stats in data['people'][0].get('stats', [])}
+    except (KeyError, IndexError) as e:
+        print(f"Warning: Unexpected game log format for {player_name}: {e}")
+        return None
+
+def get_player_game_ids(player_name, season):
+    """Get the IDs of the games a player appeared in, or None if their game log is unavailable."""
+    game_log = get_player_game_log(player_name, season)
+    if game_log is None:
+        return None
+    return {split['game']['gamePk'] for splits in game_log.values() for split in splits}
 
-def extract_player_stat_from_boxscore(boxscore_data, player_name, stat_type):
+def get_player_stats_from_game_log(player_name, season, stat_type):
+    """
+    Get running season totals for a counting stat from a player's game log, avoiding box score requests.
+
+    Args:
+        player_name: Name of the player to look up
+        season: The season year
+        stat_type: The stat to extract (e.g., 'homeRuns', 'hits', 'runs', 'rbi', 'strikeOuts')
+
+    Returns:
+        list: List of tuples (game_date, stat_value), or None if the game log can't provide the stat
+    """
+    if stat_type not in COUNTING_STATS:  # Per-game values of other stats can't be summed into season values
+        return None
+    game_log = get_player_game_log(player_name, season)
+    player = lookup_player(player_name, season)
+    if not game_log or player is None:
+        return None
+    category = STAT_CATEGORIES.get(stat_type)
+    if category is None:
+        category = 'pitching' if player.get('primaryPosition', {}).get('abbreviation') == 'P' else 'batting'
+    group = GAME_LOG_GROUPS[category]
+    splits = sorted(game_log.get(group, []), key=lambda split: split['date'])
+    if not splits or any(stat_type not in split['stat'] for split in splits):
+        return None
+
+    totals = np.cumsum([split['stat'][stat_type] for split in splits])
+    return [(split['date'], total) for split, total in zip(splits, totals.tolist())]
+
+@lru_cache(maxsize=None)
+def normalize_name(name):
+    """Normalize a player name for matching (accents stripped, lowercase)."""
+    return unidecode(name).strip().lower()
+
+def index_boxscore_players(boxscore_data):
+    """Map normalized player names to their entries in the box score data."""
+    roster = {}
+    for team in ['away', 'home']:
+        for data in boxscore_data[team]['players'].values():
+            roster.setdefault(normalize_name(data['person']['fullName']), data)
+    return roster
+
+def get_boxscore_roster(game_id):
+    """Get the indexed players for a fetched box score, using ROSTER_CACHE when available."""
+    if game_id not in ROSTER_CACHE:
+        ROSTER_CACHE[game_id] = index_boxscore_players(BOXSCORE_CACHE[game_id])
+    return ROSTER_CACHE[game_id]
+
+def extract_player_stat_from_boxscore(roster, player_name, stat_type):
     """
     Extract a specific stat for a player from box score data.
 
     Args:
-        boxscore_data: The box score data from statsapi.boxscore_data()
+        roster: The box score players from index_boxscore_players()
         player_name: Name of the player to look up
         stat_type: The stat to extract (e.g., 'homeRuns', 'hits', 'runs', 'rbi', 'strikeOuts')
 
     Returns:
         float: The stat value, or 0 if not found
     """
-    player_data = None
-    for team in ['away', 'home']:
-        for id, data in boxscore_data[team]['players'].items():
-            box_name = unidecode(data['person']['fullName']).strip().lower()
-            search_name = unidecode(player_name).strip().lower()
-            if box_name == search_name:
-                player_data = data
-                break
-        if player_data is not None:
-            break
+    player_data = roster.get(normalize_name(player_name))
     if player_data is None:  # Player not in boxscore
         return 0
 
     # Get stat from seasonStats
-    season_stats = player_data.get('seasonStats', {})
-    if player_data.get('position', {}).get('abbreviation') == 'P':
-        category = 'pitching'
-    else:
-        category = 'batting'
-    if stat_type in season_stats[category]:
-        value = season_stats[category][stat_type]
-        if value is not None and value != '-.--':
+    category = STAT_CATEGORIES.get(stat_type)
+    if category is None:
+        category = 'pitching' if player_data.get('position', {}).get('abbreviation') == 'P' else 'batting'
+    try:
+        return float(player_data['seasonStats'][category][stat_type])
+    except (KeyError, TypeError, ValueError):  # Missing stat, or a placeholder such as None or '-.--'
+        return 0
+
+
+def fetch_boxscore(game_id):
+    """Fetch box score data for a game, retrying with exponential backoff on failure."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return statsapi.boxscore_data(game_id)
+        except Exception:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+def fetch_boxscores(game_ids, desc=None):
+    """
+    Fetch box scores for the given games concurrently and store them in BOXSCORE_CACHE.
+
+    Args:
+        game_ids: Game IDs to fetch; games already in the cache are skipped
+        desc: Progress bar description
+    """
+    from tqdm import tqdm  # Imported lazily since it is only needed when downloading
+
+    game_ids = list(dict.fromkeys(game_ids))
+    missing = [game_id for game_id in game_ids if game_id not in BOXSCORE_CACHE]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_boxscore, game_id): game_id for game_id in missing}
+        for future in tqdm(as_completed(futures), total=len(game_ids), initial=len(game_ids) - len(missing), desc=desc):
+            game_id = futures[future]
             try:
-                return float(value)
-            except (ValueError, TypeError):
-                pass
+                BOXSCORE_CACHE[game_id] = future.result()
+            except Exception as e:
+                print(f"Error fetching game {game_id}: {e}")
+
+def get_team_schedule(team_id, season):
+    """Get a team's regular season schedule, using SCHEDULE_CACHE when available."""
+    if (team_id, season) not in SCHEDULE_CACHE:
+        with http_cache(season):
+            schedule = statsapi.schedule(season=season, team=team_id)
+        SCHEDULE_CACHE[(team_id, season)] = [game for game in schedule if game['game_type'] == 'R']
+    return SCHEDULE_CACHE[(team_id, season)]
 
+def group_players_by_team(player_names, season):
+    """Group player names by team ID, skipping players that could not be found."""
+    team_players = {}
+    for player in player_names:
+        team_id = get_player_team_id(player, season)
+        if team_id != 0:
+            team_players.setdefault(team_id, []).append(player)
+    return team_players
 
-def get_player_stats_from_schedule(player_name, season, stat_type):
+def get_played_game_ids(schedule, player_names, season):
+    """Get the IDs of scheduled games any of the players appeared in, or all of them if a game log is unavailable."""
+    played_game_ids = set()
+    for player in player_names:
+        game_ids = get_player_game_ids(player, season)
+        if game_ids is None:
+            return [game['game_id'] for game in schedule]
+        played_game_ids |= game_ids
+    return [game['game_id'] for game in schedule if game['game_id'] in played_game_ids]
+
+def extract_team_stats(schedule, player_names, game_ids, stat_type):
     """
-    Get all stat values for a specific player from their team's schedule using box score data.
-    Intelligently determines whether to use batting or pitching stats based on context.
+    Extract stat values for players on a team from the fetched box scores of the team's schedule.
     
     Args:
-        player_name: Name of the player to look up
-        season: The season year
+        schedule: The team's schedule from get_team_schedule()
+        player_names: Names of the players on that team to look up
+        game_ids: IDs of the games whose box scores were fetched; other games are counted as not played
         stat_type: The stat to extract (e.g., 'homeRuns', 'hits', 'runs', 'rbi', 'strikeOuts')
     
     Returns:
-        list: List of tuples (game_date, stat_value)
+        dict: Player name -> list of tuples (game_date, stat_value)
     """
-    team_id = get_player_team_id(player_name, season)
-    if team_id == 0: # Player not found
-        return []
-    if team_id in SCHEDULE_CACHE:
-        schedule = SCHEDULE_CACHE[team_id]
-    else:
-        schedule = statsapi.schedule(season=season, team=team_id)
-        schedule = [game for game in schedule if game['game_type'] == 'R']
-        SCHEDULE_CACHE[team_id] = schedule
-    stat_dates = []
-        
-    for game in tqdm(schedule, desc=f"Counting stat \"{stat_type}\" for {player_name} in {season}"):
+    game_ids = set(game_ids)
+    stat_dates = {player: [] for player in player_names}
+    for game in schedule:
+        if game['game_id'] not in game_ids:
+            # Nobody played, so every value carries forward from the previous game
+            for player in player_names:
+                stat_dates[player].append((game['game_date'], 0))
+            continue
+        if game['game_id'] not in BOXSCORE_CACHE:
+            continue
         try:
-            if game['game_id'] in BOXSCORE_CACHE:
-                boxscore_data = BOXSCORE_CACHE[game['game_id']]
-            else:
-                boxscore_data = statsapi.boxscore_data(game['game_id'])
-                BOXSCORE_CACHE[game['game_id']] = boxscore_data
-            value = extract_player_stat_from_boxscore(boxscore_data, player_name, stat_type)
-            stat_dates.append((game['game_date'], value))
+            roster = get_boxscore_roster(game['game_id'])
         except Exception as e:
             print(f"Error processing game {game['game_id']}: {e}")
             continue
+        for player in player_names:
+            try:
+                value = extract_player_stat_from_boxscore(roster, player, stat_type)
+                stat_dates[player].append((game['game_date'], value))
+            except Exception as e:
+                print(f"Error processing game {game['game_id']} for {player}: {e}")
+    return stat_dates
+
+def get_all_player_stats(team_players, season, stat_type):
+    """
+    Get all stat values for the players, from their game logs when possible and otherwise from
+    their teams' schedules using box score data. Each box score is fetched once per game across
+    all teams (unfinished games bypass the HTTP cache), then indexed once and shared by all of
+    the players.
+    
+    Args:
+        team_players: Team ID -> player names, from group_players_by_team()
+        season: The season year
+        stat_type: The stat to extract (e.g., 'homeRuns', 'hits', 'runs', 'rbi', 'strikeOuts')
+    
+    Returns:
+        dict: Player name -> list of tuples (game_date, stat_value)
+    """
+    stat_dates = {}
+    boxscore_players = {}
+    for team_id, players in team_players.items():
+        for player in players:
+            game_log_stats = get_player_stats_from_game_log(player, season, stat_type)
+            if game_log_stats is not None:
+                stat_dates[player] = game_log_stats
+        remaining = [player for player in players if player not in stat_dates]
+        if remaining:
+            boxscore_players[team_id] = remaining
+    if not boxscore_players:
+        return stat_dates
+
+    team_game_ids = {}
+    games = {}
+    for team_id, players in boxscore_players.items():
+        schedule = get_team_schedule(team_id, season)
+        team_game_ids[team_id] = get_played_game_ids(schedule, players, season)
+        games.update({game['game_id']: game for game in schedule})
+    game_ids = list(dict.fromkeys(game_id for ids in team_game_ids.values() for game_id in ids))
+
+    # Finished games never change, so their box scores can come from the HTTP cache even mid-season
+    desc = f"Counting stat \"{stat_type}\" for {', '.join(player for players in boxscore_players.values() for player in players)} in {season}"
+    finished_game_ids = {game_id for game_id in game_ids if games[game_id]['status'].startswith(FINAL_STATUSES)}
+    fetch_boxscores([game_id for game_id in game_ids if game_id in finished_game_ids], desc=desc)
+    unfinished_game_ids = [game_id for game_id in game_ids if game_id not in finished_game_ids]
+    if unfinished_game_ids:
+        with requests_cache.disabled():
+            fetch_boxscores(unfinished_game_ids, desc=desc)
+
+    for team_id, players in boxscore_players.items():
+        stat_dates.update(extract_team_stats(get_team_schedule(team_id, season), players, team_game_ids[team_id], stat_type))
     return stat_dates
 
 
@@ -144,7 +393,7 @@ def create_stats_graph(player_names, season, stat_type, stat_display_name=None):
         stat_display_name = stat_type
 
     data_folder = 'data'
-    df_path = os.path.join(data_folder, f'{stat_type}_{season}.pkl')
+    df_path = os.path.join(data_folder, f'{stat_type}_{season}.feather')
     os.makedirs(data_folder, exist_ok=True)
 
     if season == CURRENT_SEASON and os.path.exists(df_path):
@@ -153,59 +402,52 @@ def create_stats_graph(player_names, season, stat_type, stat_display_name=None):
 
     if os.path.exists(df_path):
         print("Loading existing DataFrame state...")
-        with open(df_path, 'rb') as f:
-            df = pickle.load(f)
+        df = pd.read_feather(df_path)
         new_players = [player for player in player_names if player not in df.columns]      
     else:
         print("Creating new DataFrame...")
-        team = 0
-        for player in player_names:
-            team = get_player_team_id(player, season)
-            if team > 0:
-                break
-        if team == 0:
+        df = None
+        new_players = player_names
+    team_players = group_players_by_team(new_players, season)
+
+    if df is None:
+        if not team_players:
             print("Warning: No valid players found in list")
             return None
-        schedule = statsapi.schedule(season=season, team=team)
-        schedule = [game for game in schedule if game['game_type'] == 'R']
-        SCHEDULE_CACHE[team] = schedule
+        schedule = get_team_schedule(next(iter(team_players)), season)
         start_date = pd.to_datetime(schedule[0]['game_date'])
         end_date = pd.to_datetime(schedule[-1]['game_date'])
         dates = pd.date_range(start=start_date, end=end_date)
         df_data = {'Date': dates}
         df = pd.DataFrame(df_data)
-        new_players = player_names
         
-    # Track original columns for possible revert
-    original_columns = df.columns.copy()
-    actually_added_players = []
+    new_columns = {}
     if new_players:
         print(f"Adding new players: {', '.join(new_players)}")
-        for player in new_players:
-            stat_dates = get_player_stats_from_schedule(player, season, stat_type)
-            if stat_dates:
-                df[player] = 0.0
-                update_stat(df, player, stat_dates)
-                actually_added_players.append(player)
+        player_stats = get_all_player_stats(team_players, season, stat_type)
+        new_columns = build_stat_columns(get_date_index(df), {player: player_stats.get(player) for player in new_players}, stat_type)
+    if new_columns:
+        # Insert all new columns at once to avoid fragmenting the frame
+        df = pd.concat([df, pd.DataFrame(new_columns, index=df.index)], axis=1).copy()
+    actually_added_players = list(new_columns)
     plot_players = [player for player in player_names if player in df.columns]
-    for player in plot_players:
-        plt.plot(df['Date'], df[player], label=player)
-    plt.xlabel('Date')
-    plt.ylabel(f'{stat_display_name}')
-    plt.title(f'{stat_display_name}: {' vs. '.join(plot_players)} ({pd.to_datetime(df['Date'].iloc[0]).year})')
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.show()
+    if plot_players:
+        import matplotlib.pyplot as plt  # Imported lazily to keep module import fast
+        ax = df.set_index('Date')[plot_players].plot()
+        ax.set_xlabel('Date')
+        ax.set_ylabel(f'{stat_display_name}')
+        ax.set_title(f'{stat_display_name}: {' vs. '.join(plot_players)} ({pd.to_datetime(df['Date'].iloc[0]).year})')
+        ax.grid(True, alpha=0.3)
+        plt.tight_layout()
+        plt.show()
     
     if actually_added_players:
         save_or_delete = input(f"Save Data with new players {', '.join(actually_added_players)}? (y/n): ")
         if save_or_delete.lower() == 'y' or not save_or_delete:
-            with open(df_path, 'wb') as f:
-                pickle.dump(df, f)
+            df.to_feather(df_path, compression='uncompressed')
             print(f"DataFrame state saved to {df_path}")
         else:
-            df = df[original_columns]
+            df.drop(columns=actually_added_players, inplace=True)
             print("DataFrame reverted to previous state; new players not saved.")
     else:
         print("No new players added; DataFrame unchanged.")